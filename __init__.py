@@ -80,6 +80,7 @@ from .methods import (
     block_user_full,
     block_user_prevent_trigger,
     cleanup,
+    init,
     inject_block_status_prompt,
     list_blocked_users,
     unblock_user,
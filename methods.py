@@ -1,6 +1,8 @@
 """插件方法实现"""
 
+import io
 import time
+from itertools import islice
 from typing import Optional
 
 from nekro_agent.api import core
@@ -10,39 +12,35 @@ from nekro_agent.api.schemas import AgentCtx
 from .models import BlockRecord, BlockType
 from .plugin import config, plugin
 from .utils import (
+    BLOCK_TYPE_SYMBOLS,
     apply_block_to_system,
+    block_store,
     calculate_expire_time,
     format_time_remaining,
-    get_block_data,
     get_block_type_description,
     get_user_by_unique_id,
+    humanize_duration,
     remove_block_from_system,
-    save_block_data,
 )
 
 
-@plugin.mount_sandbox_method(SandboxMethodType.BEHAVIOR, "屏蔽用户_禁止触发模式")
-async def block_user_prevent_trigger(
+async def _do_block(
     _ctx: AgentCtx,
     user_identifier: str,
-    reason: str = "未说明原因",
-    duration_seconds: Optional[int] = None,
+    reason: str,
+    duration_seconds: Optional[int],
+    block_type: BlockType,
+    mode_label: str,
+    effect_text: str,
 ) -> str:
-    """屏蔽用户（禁止触发模式）
-
-    当你决定屏蔽某个用户时使用此功能。被屏蔽后，该用户发送的消息你仍能看到（当被其他消息或触发条件唤醒时），但他的消息无法直接唤醒你。
-    适用场景：用户频繁@你或刷屏，但你仍想保留观察他的权利。
+    """屏蔽用户的通用实现
 
     Args:
-        user_identifier (str): 用户的平台ID
-        reason (str): 屏蔽原因，建议说明具体理由
-        duration_seconds (int): 屏蔽时长（秒），不传则使用默认值，传None或负数表示永久（需要配置允许）
-
-    Returns:
-        str: 操作结果描述
+        block_type: 屏蔽类型
+        mode_label: 屏蔽模式名称，用于日志和返回信息
+        effect_text: 屏蔽效果说明
     """
-    if not config.ENABLE_PREVENT_TRIGGER:
-        return "❌ 禁止触发功能未启用，请联系管理员开启"
+    current_time = int(time.time())
 
     # 处理屏蔽时长
     if duration_seconds is None or duration_seconds < 0:
@@ -53,17 +51,14 @@ async def block_user_prevent_trigger(
         else:
             duration_seconds = config.DEFAULT_BLOCK_SECONDS
             is_permanent = False
-            expire_time = calculate_expire_time(duration_seconds)
+            expire_time = calculate_expire_time(duration_seconds, now=current_time)
     else:
         is_permanent = False
-        expire_time = calculate_expire_time(duration_seconds)
+        expire_time = calculate_expire_time(duration_seconds, now=current_time)
 
     # 查找用户
     from nekro_agent.models.db_user import DBUser
 
-    user = None
-    user_id = None
-
     user = await DBUser.get_or_none(
         adapter_key=_ctx.adapter_key,
         platform_userid=user_identifier,
@@ -75,52 +70,77 @@ async def block_user_prevent_trigger(
     user_id = user.unique_id
 
     # 获取屏蔽数据
-    block_data = await get_block_data(_ctx.chat_key)
+    block_data = await block_store.get(_ctx.chat_key)
 
     # 检查是否已经被屏蔽
     existing_block = block_data.get_block(user_id)
     if existing_block:
         return f"⚠️ 用户 {user.username} 已经被{get_block_type_description(existing_block.block_type)}，无需重复操作"
 
-    # 创建屏蔽记录
+    # 应用到系统，成功后再写入插件数据，避免两边状态不一致
+    success = await apply_block_to_system(user, block_type, expire_time)
+
+    if not success:
+        return f"❌ 屏蔽用户 {user.username} 失败，请稍后重试"
+
+    # 创建屏蔽记录并保存到插件数据（由后台异步写回存储）
     record = BlockRecord(
         user_id=user_id,
         username=user.username,
-        block_type=BlockType.PREVENT_TRIGGER,
+        block_type=block_type,
         reason=reason,
-        start_time=int(time.time()),
+        start_time=current_time,
         expire_time=expire_time,
         is_permanent=is_permanent,
     )
-
-    # 保存到插件数据
     block_data.add_block(record)
-    await save_block_data(_ctx.chat_key, block_data)
-
-    # 应用到系统
-    success = await apply_block_to_system(user_id, BlockType.PREVENT_TRIGGER, expire_time)
-
-    if not success:
-        return f"❌ 屏蔽用户 {user.username} 失败，请稍后重试"
+    block_store.mark_dirty(_ctx.chat_key, block_data)
 
     if is_permanent:
         time_desc = "永久"
         log_time_desc = "永久"
     else:
-        # 转换秒数为可读格式
         assert duration_seconds is not None  # 类型保证
-        hours = duration_seconds // 3600
-        minutes = (duration_seconds % 3600) // 60
-        if hours > 0:
-            time_desc = f"{hours}小时" if minutes == 0 else f"{hours}小时{minutes}分钟"
-        else:
-            time_desc = f"{minutes}分钟"
-        log_time_desc = f"{time_desc}({duration_seconds}秒)"
+        time_desc, log_time_desc = humanize_duration(duration_seconds)
 
     core.logger.info(
-        f"[屏蔽插件] AI在聊天 {_ctx.chat_key} 中屏蔽了用户 {user.username}({user_id}) - 禁止触发模式，时长: {log_time_desc}，原因: {reason}",
+        f"[屏蔽插件] AI在聊天 {_ctx.chat_key} 中屏蔽了用户 {user.username}({user_id}) - {mode_label}，时长: {log_time_desc}，原因: {reason}",
+    )
+    return f"✅ 已将用户 {user.username} 设置为{mode_label}（时长: {time_desc}）\n原因: {reason}\n效果: {effect_text}"
+
+
+@plugin.mount_sandbox_method(SandboxMethodType.BEHAVIOR, "屏蔽用户_禁止触发模式")
+async def block_user_prevent_trigger(
+    _ctx: AgentCtx,
+    user_identifier: str,
+    reason: str = "未说明原因",
+    duration_seconds: Optional[int] = None,
+) -> str:
+    """屏蔽用户（禁止触发模式）
+
+    当你决定屏蔽某个用户时使用此功能。被屏蔽后，该用户发送的消息你仍能看到（当被其他消息或触发条件唤醒时），但他的消息无法直接唤醒你。
+    适用场景：用户频繁@你或刷屏，但你仍想保留观察他的权利。
+
+    Args:
+        user_identifier (str): 用户的平台ID
+        reason (str): 屏蔽原因，建议说明具体理由
+        duration_seconds (int): 屏蔽时长（秒），不传则使用默认值，传None或负数表示永久（需要配置允许）
+
+    Returns:
+        str: 操作结果描述
+    """
+    if not config.ENABLE_PREVENT_TRIGGER:
+        return "❌ 禁止触发功能未启用，请联系管理员开启"
+
+    return await _do_block(
+        _ctx,
+        user_identifier,
+        reason,
+        duration_seconds,
+        block_type=BlockType.PREVENT_TRIGGER,
+        mode_label="禁止触发模式",
+        effect_text="该用户无法直接唤醒我，但我在被其他消息唤醒时仍能看到他的消息",
     )
-    return f"✅ 已将用户 {user.username} 设置为禁止触发模式（时长: {time_desc}）\n原因: {reason}\n效果: 该用户无法直接唤醒我，但我在被其他消息唤醒时仍能看到他的消息"
 
 
 @plugin.mount_sandbox_method(SandboxMethodType.BEHAVIOR, "屏蔽用户_完全屏蔽模式")
@@ -146,83 +166,15 @@ async def block_user_full(
     if not config.ENABLE_FULL_BLOCK:
         return "❌ 完全屏蔽功能未启用，请联系管理员开启"
 
-    # 处理屏蔽时长
-    if duration_seconds is None or duration_seconds < 0:
-        if config.ALLOW_PERMANENT_BLOCK:
-            is_permanent = True
-            expire_time = None
-            duration_seconds = None
-        else:
-            duration_seconds = config.DEFAULT_BLOCK_SECONDS
-            is_permanent = False
-            expire_time = calculate_expire_time(duration_seconds)
-    else:
-        is_permanent = False
-        expire_time = calculate_expire_time(duration_seconds)
-
-    # 查找用户
-    from nekro_agent.models.db_user import DBUser
-
-    user = None
-    user_id = None
-
-    user = await DBUser.get_or_none(
-        adapter_key=_ctx.adapter_key,
-        platform_userid=user_identifier,
-    )
-
-    if not user:
-        return f"❌ 未找到用户: {user_identifier}"
-
-    user_id = user.unique_id
-
-    # 获取屏蔽数据
-    block_data = await get_block_data(_ctx.chat_key)
-
-    # 检查是否已经被屏蔽
-    existing_block = block_data.get_block(user_id)
-    if existing_block:
-        return f"⚠️ 用户 {user.username} 已经被{get_block_type_description(existing_block.block_type)}，无需重复操作"
-
-    # 创建屏蔽记录
-    record = BlockRecord(
-        user_id=user_id,
-        username=user.username,
+    return await _do_block(
+        _ctx,
+        user_identifier,
+        reason,
+        duration_seconds,
         block_type=BlockType.FULL_BLOCK,
-        reason=reason,
-        start_time=int(time.time()),
-        expire_time=expire_time,
-        is_permanent=is_permanent,
-    )
-
-    # 保存到插件数据
-    block_data.add_block(record)
-    await save_block_data(_ctx.chat_key, block_data)
-
-    # 应用到系统
-    success = await apply_block_to_system(user_id, BlockType.FULL_BLOCK, expire_time)
-
-    if not success:
-        return f"❌ 屏蔽用户 {user.username} 失败，请稍后重试"
-
-    if is_permanent:
-        time_desc = "永久"
-        log_time_desc = "永久"
-    else:
-        # 转换秒数为可读格式
-        assert duration_seconds is not None  # 类型保证
-        hours = duration_seconds // 3600
-        minutes = (duration_seconds % 3600) // 60
-        if hours > 0:
-            time_desc = f"{hours}小时" if minutes == 0 else f"{hours}小时{minutes}分钟"
-        else:
-            time_desc = f"{minutes}分钟"
-        log_time_desc = f"{time_desc}({duration_seconds}秒)"
-
-    core.logger.info(
-        f"[屏蔽插件] AI在聊天 {_ctx.chat_key} 中完全屏蔽了用户 {user.username}({user_id})，时长: {log_time_desc}，原因: {reason}",
+        mode_label="完全屏蔽模式",
+        effect_text="我将完全看不到该用户的任何消息",
     )
-    return f"✅ 已将用户 {user.username} 设置为完全屏蔽模式（时长: {time_desc}）\n原因: {reason}\n效果: 我将完全看不到该用户的任何消息"
 
 
 @plugin.mount_sandbox_method(SandboxMethodType.BEHAVIOR, "解除用户屏蔽")
@@ -254,7 +206,7 @@ async def unblock_user(_ctx: AgentCtx, user_identifier: str) -> str:
     user_id = user.unique_id
 
     # 获取屏蔽数据
-    block_data = await get_block_data(_ctx.chat_key)
+    block_data = await block_store.get(_ctx.chat_key)
 
     # 检查是否被屏蔽
     block_record = block_data.get_block(user_id)
@@ -262,14 +214,14 @@ async def unblock_user(_ctx: AgentCtx, user_identifier: str) -> str:
         return f"ℹ️ 用户 {user.username} 当前没有被屏蔽"
 
     # 从系统移除屏蔽
-    success = await remove_block_from_system(user_id, block_record.block_type)
+    success = await remove_block_from_system(user, block_record.block_type)
 
     if not success:
         return f"❌ 解除用户 {user.username} 的屏蔽失败，请稍后重试"
 
     # 从插件数据移除
     block_data.remove_block(user_id)
-    await save_block_data(_ctx.chat_key, block_data)
+    block_store.mark_dirty(_ctx.chat_key, block_data)
 
     core.logger.info(
         f"[屏蔽插件] AI在聊天 {_ctx.chat_key} 中解除了用户 {user.username}({user_id}) 的屏蔽",
@@ -286,14 +238,14 @@ async def list_blocked_users(_ctx: AgentCtx) -> str:
     Returns:
         str: 已屏蔽用户的详细信息（包括用户名、屏蔽类型、剩余时间、屏蔽原因）
     """
-    block_data = await get_block_data(_ctx.chat_key)
+    block_data = await block_store.get(_ctx.chat_key)
 
     # 清理过期的插件记录
     # 注意：系统层面的屏蔽会在到期时由DBUser自动解除，这里只是清理插件数据
     current_time = int(time.time())
     cleaned = block_data.cleanup_expired(current_time)
     if cleaned > 0:
-        await save_block_data(_ctx.chat_key, block_data)
+        block_store.mark_dirty(_ctx.chat_key, block_data)
         core.logger.info(f"[屏蔽插件] 自动清理了 {cleaned} 个过期的屏蔽记录")
 
     # 获取有效屏蔽记录
@@ -302,86 +254,99 @@ async def list_blocked_users(_ctx: AgentCtx) -> str:
     if not active_blocks:
         return "当前没有被屏蔽的用户"
 
-    # 构建详细列表
-    lines = ["当前已屏蔽的用户：\n"]
+    # 构建详细列表，循环内用到的全局函数先取为局部变量
+    format_remaining = format_time_remaining
+    describe_type = get_block_type_description
+    buf = io.StringIO()
+    buf.write("当前已屏蔽的用户：\n")
     for idx, (user_id, record) in enumerate(active_blocks.items(), 1):
-        time_remaining = format_time_remaining(record.expire_time)
-        block_desc = get_block_type_description(record.block_type)
-        lines.append(
-            f"{idx}. {record.username} ({user_id})\n"
+        time_remaining = format_remaining(record.expire_time, now=current_time)
+        block_desc = describe_type(record.block_type)
+        buf.write(
+            f"\n{idx}. {record.username} ({user_id})\n"
             f"   - 屏蔽类型: {block_desc}\n"
             f"   - 剩余时间: {time_remaining}\n"
             f"   - 屏蔽原因: {record.reason}",
         )
 
-    return "\n".join(lines)
+    return buf.getvalue()
+
+
+async def _write_blocked_users_prompt(buf: io.StringIO, chat_key: str) -> None:
+    """将当前聊天的已屏蔽用户列表写入提示词"""
+    block_data = await block_store.get(chat_key)
+
+    # 清理过期的插件记录
+    current_time = int(time.time())
+    if block_data.cleanup_expired(current_time):
+        block_store.mark_dirty(chat_key, block_data)
+
+    # 获取有效屏蔽记录，只取出需要显示的部分
+    active_blocks = block_data.iter_active_blocks(current_time)
+    max_display = config.MAX_PROMPT_DISPLAY_COUNT
+    display_blocks = list(islice(active_blocks, max_display))
+
+    if display_blocks:
+        # 构建屏蔽用户列表，循环内用到的全局对象先取为局部变量
+        format_remaining = format_time_remaining
+        symbols = BLOCK_TYPE_SYMBOLS
+        buf.write("\n\nCurrently Blocked Users:")
+        for _user_id, record in display_blocks:
+            time_desc = "∞" if record.is_permanent else format_remaining(record.expire_time, now=current_time)
+            block_symbol = symbols[record.block_type]
+            buf.write(f"\n  {block_symbol} {record.username} ({time_desc}) - {record.reason}")
+
+        # 剩余未显示的数量
+        hidden_count = sum(1 for _ in active_blocks)
+        if hidden_count:
+            buf.write(f"\n  ... and {hidden_count} more")
 
 
 @plugin.mount_prompt_inject_method("block_plugin_status")
 async def inject_block_status_prompt(_ctx: AgentCtx) -> str:
     """注入屏蔽插件状态到提示词"""
     try:
-        prompt_parts = []
+        buf = io.StringIO()
 
         # 1. 注入插件配置状态
-        config_lines = ["User Block Plugin Configuration:"]
+        buf.write("User Block Plugin Configuration:")
 
         # 功能开关状态
         if config.ENABLE_PREVENT_TRIGGER:
-            config_lines.append("  - Prevent Trigger Mode: Enabled")
+            buf.write("\n  - Prevent Trigger Mode: Enabled")
         if config.ENABLE_FULL_BLOCK:
-            config_lines.append("  - Full Block Mode: Enabled")
+            buf.write("\n  - Full Block Mode: Enabled")
 
         # 永久屏蔽权限
         if config.ALLOW_PERMANENT_BLOCK:
-            config_lines.append("  - Permanent Block: Allowed")
+            buf.write("\n  - Permanent Block: Allowed")
         else:
-            config_lines.append("  - Permanent Block: Not Allowed (use time-limited blocks only)")
+            buf.write("\n  - Permanent Block: Not Allowed (use time-limited blocks only)")
 
         # 时长限制
         max_hours = config.MAX_BLOCK_SECONDS // 3600
         default_hours = config.DEFAULT_BLOCK_SECONDS // 3600
-        config_lines.append(f"  - Max Duration: {max_hours}h, Default: {default_hours}h")
-
-        prompt_parts.append("\n".join(config_lines))
+        buf.write(f"\n  - Max Duration: {max_hours}h, Default: {default_hours}h")
 
-        # 2. 注入已屏蔽用户列表
+        # 2. 注入已屏蔽用户列表，关闭时不访问屏蔽数据
         if config.SHOW_BLOCKED_USERS_IN_PROMPT:
-            block_data = await get_block_data(_ctx.chat_key)
+            await _write_blocked_users_prompt(buf, _ctx.chat_key)
 
-            # 清理过期的插件记录
-            current_time = int(time.time())
-            block_data.cleanup_expired(current_time)
-            await save_block_data(_ctx.chat_key, block_data)
-
-            # 获取有效屏蔽记录
-            active_blocks = block_data.get_active_blocks(current_time)
-
-            if active_blocks:
-                # 限制显示数量
-                display_count = min(len(active_blocks), config.MAX_PROMPT_DISPLAY_COUNT)
-                display_blocks = list(active_blocks.items())[:display_count]
-
-                # 构建屏蔽用户列表
-                block_lines = ["Currently Blocked Users:"]
-                for _user_id, record in display_blocks:
-                    time_desc = "∞" if record.is_permanent else format_time_remaining(record.expire_time)
-                    block_symbol = "🚫" if record.block_type == BlockType.FULL_BLOCK else "🔇"
-                    block_lines.append(f"  {block_symbol} {record.username} ({time_desc}) - {record.reason}")
-
-                if len(active_blocks) > display_count:
-                    block_lines.append(f"  ... and {len(active_blocks) - display_count} more")
-
-                prompt_parts.append("\n".join(block_lines))
-
-        return "\n\n".join(prompt_parts) if prompt_parts else ""
+        return buf.getvalue()
 
     except Exception as e:
         core.logger.warning(f"[屏蔽插件] 提示词注入失败: {e}")
         return ""
 
 
+@plugin.mount_init_method()
+async def init():
+    """初始化方法"""
+    block_store.start()
+
+
 @plugin.mount_cleanup_method()
 async def cleanup():
     """清理方法"""
+    await block_store.drain()
     core.logger.info("[屏蔽插件] 清理完成")
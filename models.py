@@ -1,11 +1,15 @@
 """数据模型"""
 
+import heapq
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Dict, Optional
+from typing import Annotated, Dict, Iterator, List, Optional, Tuple
 
 from pydantic import BaseModel, Field
 
+_MISSING = object()
+
 
 class BlockType(str, Enum):
     """屏蔽类型"""
@@ -14,36 +18,43 @@ class BlockType(str, Enum):
     FULL_BLOCK = "full_block"  # 完全屏蔽：完全看不到该用户的消息
 
 
-class BlockRecord(BaseModel):
+@dataclass(slots=True, kw_only=True)
+class BlockRecord:
     """屏蔽记录"""
 
-    user_id: str = Field(description="用户唯一标识 (adapter_key:platform_userid)")
-    username: str = Field(description="用户名")
-    block_type: BlockType = Field(description="屏蔽类型")
-    reason: str = Field(default="", description="屏蔽原因")
-    start_time: int = Field(description="开始时间戳")
-    expire_time: Optional[int] = Field(default=None, description="到期时间戳，None表示永久")
-    is_permanent: bool = Field(default=False, description="是否永久屏蔽")
+    user_id: str  # 用户唯一标识 (adapter_key:platform_userid)
+    username: str  # 用户名
+    block_type: BlockType  # 屏蔽类型
+    reason: str = ""  # 屏蔽原因
+    start_time: int  # 开始时间戳
+    expire_time: Optional[int] = None  # 到期时间戳，None表示永久
+    is_permanent: bool = False  # 是否永久屏蔽
 
 
-class BlockData(BaseModel):
+@dataclass(slots=True)
+class BlockData:
     """屏蔽数据存储"""
 
-    blocks: Dict[str, BlockRecord] = Field(
-        default_factory=dict,
-        description="屏蔽记录字典，key为user_id",
+    blocks: Dict[str, BlockRecord] = field(default_factory=dict)  # 屏蔽记录字典，key为user_id
+
+    # 到期时间最小堆 (expire_time, user_id)，首次清理时构建；移除或替换的记录采用惰性删除。不参与序列化
+    _expiry_heap: Annotated[Optional[List[Tuple[int, str]]], Field(exclude=True)] = field(
+        default=None,
+        init=False,
+        repr=False,
+        compare=False,
     )
 
     def add_block(self, record: BlockRecord) -> None:
         """添加屏蔽记录"""
         self.blocks[record.user_id] = record
+        heap = self._expiry_heap
+        if heap is not None and not record.is_permanent and record.expire_time:
+            heapq.heappush(heap, (record.expire_time, record.user_id))
 
     def remove_block(self, user_id: str) -> bool:
         """移除屏蔽记录"""
-        if user_id in self.blocks:
-            del self.blocks[user_id]
-            return True
-        return False
+        return self.blocks.pop(user_id, _MISSING) is not _MISSING
 
     def get_block(self, user_id: str) -> Optional[BlockRecord]:
         """获取屏蔽记录"""
@@ -53,28 +64,50 @@ class BlockData(BaseModel):
         """检查用户是否被屏蔽"""
         return user_id in self.blocks
 
-    def get_active_blocks(self, current_time: int) -> Dict[str, BlockRecord]:
-        """获取所有有效的屏蔽记录"""
-        active = {}
+    def iter_active_blocks(self, current_time: int) -> Iterator[Tuple[str, BlockRecord]]:
+        """逐个产出有效的屏蔽记录 (user_id, record)"""
         for user_id, record in self.blocks.items():
             if record.is_permanent or (record.expire_time and record.expire_time > current_time):
-                active[user_id] = record
-        return active
+                yield user_id, record
+
+    def get_active_blocks(self, current_time: int) -> Dict[str, BlockRecord]:
+        """获取所有有效的屏蔽记录"""
+        return dict(self.iter_active_blocks(current_time))
 
     def cleanup_expired(self, current_time: int) -> int:
         """清理已过期的屏蔽记录，返回清理数量
         注意：这只是清理插件数据的记录，系统层面的屏蔽会在到期时自动解除
         """
-        expired_users = []
-        for user_id, record in self.blocks.items():
-            # 只清理有明确过期时间的非永久屏蔽
-            if not record.is_permanent and record.expire_time and record.expire_time <= current_time:
-                expired_users.append(user_id)
-
-        for user_id in expired_users:
+        if not self.blocks:
+            return 0
+
+        heap = self._expiry_heap
+        if heap is None:
+            heap = self._build_expiry_heap()
+        removed = 0
+        # 堆顶未到期时直接返回
+        while heap and heap[0][0] <= current_time:
+            expire_time, user_id = heapq.heappop(heap)
+            record = self.blocks.get(user_id)
+            # 记录已被移除或替换时跳过
+            if record is None or record.is_permanent or record.expire_time != expire_time:
+                continue
             del self.blocks[user_id]
-
-        return len(expired_users)
+            removed += 1
+
+        return removed
+
+    def _build_expiry_heap(self) -> List[Tuple[int, str]]:
+        """从现有记录构建到期时间堆"""
+        # 只索引有明确过期时间的非永久屏蔽
+        heap = [
+            (record.expire_time, user_id)
+            for user_id, record in self.blocks.items()
+            if not record.is_permanent and record.expire_time
+        ]
+        heapq.heapify(heap)
+        self._expiry_heap = heap
+        return heap
 
 
 class BlockStats(BaseModel):
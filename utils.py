@@ -1,29 +1,209 @@
 """工具函数"""
 
+import asyncio
 import time
 from datetime import datetime
-from typing import Optional, cast
+from typing import Dict, Optional, Set, Tuple, Union, cast
 
+from pydantic import TypeAdapter
+
+from nekro_agent.api import core
 from nekro_agent.api.schemas import AgentCtx
 from nekro_agent.models.db_user import DBUser
 
-from .models import BlockData, BlockRecord, BlockType
+from .models import BlockData, BlockType
 from .plugin import config, plugin
 
 store = plugin.store
 
+# BlockData 为 dataclass，序列化和校验通过缓存的 TypeAdapter 进行
+_BLOCK_DATA_ADAPTER = TypeAdapter(BlockData)
+
+# 屏蔽类型的描述和提示词中使用的标识
+BLOCK_TYPE_DESCRIPTIONS: Dict[BlockType, str] = {
+    BlockType.PREVENT_TRIGGER: "禁止触发（可见但无法主动唤醒）",
+    BlockType.FULL_BLOCK: "完全屏蔽（完全不可见）",
+}
+BLOCK_TYPE_SYMBOLS: Dict[BlockType, str] = {
+    BlockType.PREVENT_TRIGGER: "🔇",
+    BlockType.FULL_BLOCK: "🚫",
+}
+
+# 屏蔽数据写回存储的批次窗口（秒）
+_FLUSH_INTERVAL = 0.1
+# 单个聊天写回失败后重试的最大等待时间（秒），等待时间从批次窗口起逐次翻倍
+_MAX_RETRY_DELAY = 30.0
+# 停止时写回剩余数据的最多尝试次数，期间不等待退避
+_DRAIN_ATTEMPTS = 3
+
+
+class _BlockStore:
+    """屏蔽数据的进程内索引
+
+    有屏蔽记录的聊天首次访问时从插件存储加载并常驻内存，之后的读取不再产生 I/O；
+    没有屏蔽记录的聊天只记录 chat_key，不缓存数据对象；
+    修改后通过 `mark_dirty` 标记，由后台任务按批次异步写回存储，
+    同一批次窗口内对同一聊天的多次标记合并为一次写入，不同聊天的写入并发执行；
+    写入失败的聊天会重新标记，并按聊天分别以递增的间隔重试，不影响其他聊天的写入
+    """
+
+    def __init__(self) -> None:
+        self._cache: Dict[str, BlockData] = {}
+        # 已知没有屏蔽记录的聊天，读取时直接返回空数据
+        self._empty: Set[str] = set()
+        # 首次加载期间使用的锁，加载完成后移除
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._dirty: Set[str] = set()
+        self._flush_event = asyncio.Event()
+        # 写回失败的聊天：下次重试的时间（事件循环时间）和当前退避间隔
+        self._retry_at: Dict[str, float] = {}
+        self._retry_delay: Dict[str, float] = {}
+        self._closing = asyncio.Event()
+        self._flusher: Optional["asyncio.Task[None]"] = None
+
+    async def get(self, chat_key: str) -> BlockData:
+        """获取屏蔽数据
+
+        有屏蔽记录时同一 chat_key 返回同一个实例，调用方对其的修改立即对其他调用可见；
+        没有屏蔽记录时返回未缓存的空数据，修改后需通过 `mark_dirty` 提交
+        """
+        cached = self._cache.get(chat_key)
+        if cached is not None:
+            return cached
+        if chat_key in self._empty:
+            return BlockData()
+
+        lock = self._locks.get(chat_key)
+        if lock is None:
+            lock = self._locks[chat_key] = asyncio.Lock()
+        try:
+            async with lock:
+                # 等待锁期间可能已被其他协程加载
+                cached = self._cache.get(chat_key)
+                if cached is not None:
+                    return cached
+                if chat_key in self._empty:
+                    return BlockData()
+
+                data = await store.get(chat_key=chat_key, store_key="blocks")
+                block_data = _BLOCK_DATA_ADAPTER.validate_json(data) if data else BlockData()
+                if not block_data.blocks:
+                    self._empty.add(chat_key)
+                    return block_data
+                return self._cache.setdefault(chat_key, block_data)
+        finally:
+            if self._locks.get(chat_key) is lock:
+                del self._locks[chat_key]
+
+    def mark_dirty(self, chat_key: str, data: BlockData) -> None:
+        """标记屏蔽数据已修改，等待后台写回
+
+        Args:
+            chat_key: 聊天标识
+            data: 修改后的屏蔽数据，即 `get` 返回的实例
+        """
+        cached = self._cache.setdefault(chat_key, data)
+        if cached is not data:
+            # 并发获取的未缓存空数据，将其中的记录合并到已缓存的实例
+            for record in data.blocks.values():
+                cached.add_block(record)
+        self._empty.discard(chat_key)
+        self._dirty.add(chat_key)
+        self._flush_event.set()
+        self.start()
+
+    def start(self) -> None:
+        """启动后台写回任务"""
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def drain(self) -> None:
+        """等待所有待写回的数据落盘并停止后台任务"""
+        self._closing.set()
+        self._flush_event.set()
+        try:
+            if self._flusher is not None:
+                await self._flusher
+            for _ in range(_DRAIN_ATTEMPTS):
+                await self._flush_pending(force=True)
+                if not self._dirty:
+                    break
+            if self._dirty:
+                core.logger.error(
+                    f"[屏蔽插件] 以下聊天的屏蔽数据未能保存，重启后将丢失最近的修改: {', '.join(sorted(self._dirty))}",
+                )
+        finally:
+            self._flusher = None
+            self._closing.clear()
+
+    async def _flush_loop(self) -> None:
+        while not self._closing.is_set():
+            # 等待新的修改，或最早一个失败聊天的重试时间
+            await _wait_event(self._flush_event, self._next_retry_delay())
+            # 批次窗口，期间的修改合并到同一批写入；等待可被 drain 打断，剩余数据由 drain 直接写回
+            if await _wait_event(self._closing, _FLUSH_INTERVAL):
+                return
+            await self._flush_pending()
+
+    def _next_retry_delay(self) -> Optional[float]:
+        """距最早一个待重试聊天的重试时间（秒），没有待重试的聊天时返回 None"""
+        retry_times = [self._retry_at[chat_key] for chat_key in self._dirty if chat_key in self._retry_at]
+        if not retry_times:
+            return None
+        return max(0.0, min(retry_times) - asyncio.get_running_loop().time())
+
+    async def _flush_pending(self, *, force: bool = False) -> None:
+        """写回已标记的聊天，force 为 True 时忽略失败聊天的重试间隔"""
+        self._flush_event.clear()
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # 取出到期的待写聊天，写入期间的新修改进入下一批次
+        pending = [chat_key for chat_key in self._dirty if force or self._retry_at.get(chat_key, 0.0) <= now]
+        if not pending:
+            return
+        self._dirty.difference_update(pending)
+        results = await asyncio.gather(*(self._write(chat_key) for chat_key in pending))
+
+        now = loop.time()
+        for chat_key, ok in zip(pending, results):
+            if ok:
+                self._retry_at.pop(chat_key, None)
+                self._retry_delay.pop(chat_key, None)
+                continue
+            # 重新标记失败的聊天，按各自的退避间隔重试
+            delay = min(self._retry_delay.get(chat_key, _FLUSH_INTERVAL) * 2, _MAX_RETRY_DELAY)
+            self._retry_delay[chat_key] = delay
+            self._retry_at[chat_key] = now + delay
+            self._dirty.add(chat_key)
+
+    async def _write(self, chat_key: str) -> bool:
+        """写回单个聊天的屏蔽数据，返回是否成功"""
+        data = self._cache.get(chat_key)
+        if data is None:
+            return True
+        try:
+            await store.set(chat_key=chat_key, store_key="blocks", value=_BLOCK_DATA_ADAPTER.dump_json(data).decode())
+        except Exception as e:
+            core.logger.warning(f"[屏蔽插件] 保存聊天 {chat_key} 的屏蔽数据失败，稍后重试: {e}")
+            return False
+
+        # 记录已全部移除且没有新的修改时不再缓存数据对象
+        if not data.blocks and chat_key not in self._dirty and self._cache.get(chat_key) is data:
+            del self._cache[chat_key]
+            self._empty.add(chat_key)
+        return True
+
 
-async def get_block_data(chat_key: str) -> BlockData:
-    """获取屏蔽数据"""
-    data = await store.get(chat_key=chat_key, store_key="blocks")
-    if data:
-        return BlockData.model_validate_json(data)
-    return BlockData()
+block_store = _BlockStore()
 
 
-async def save_block_data(chat_key: str, data: BlockData) -> None:
-    """保存屏蔽数据"""
-    await store.set(chat_key=chat_key, store_key="blocks", value=data.model_dump_json())
+async def _wait_event(event: asyncio.Event, timeout: Optional[float]) -> bool:
+    """等待事件，最多等待 timeout 秒（None 表示不限时），返回事件是否已触发"""
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
 
 
 async def get_user_by_unique_id(unique_id: str) -> Optional[DBUser]:
@@ -42,13 +222,19 @@ async def get_user_by_unique_id(unique_id: str) -> Optional[DBUser]:
         return None
 
 
-def format_time_remaining(expire_time: Optional[int]) -> str:
-    """格式化剩余时间"""
+def format_time_remaining(expire_time: Optional[int], *, now: Optional[int] = None) -> str:
+    """格式化剩余时间
+
+    Args:
+        expire_time: 到期时间戳，None表示永久
+        now: 当前时间戳，批量格式化时由调用方传入以避免重复取时间
+    """
     if expire_time is None:
         return "永久"
 
-    current_time = int(time.time())
-    remaining_seconds = expire_time - current_time
+    if now is None:
+        now = int(time.time())
+    remaining_seconds = expire_time - now
 
     if remaining_seconds <= 0:
         return "已过期"
@@ -64,11 +250,29 @@ def format_time_remaining(expire_time: Optional[int]) -> str:
     return f"{minutes}分钟"
 
 
-def calculate_expire_time(seconds: Optional[int]) -> Optional[int]:
+def humanize_duration(seconds: int) -> Tuple[str, str]:
+    """将屏蔽时长（秒）转换为可读格式
+
+    Returns:
+        (展示用描述, 日志用描述)
+    """
+    hours, rem = divmod(seconds, 3600)
+    minutes = rem // 60
+    if hours and minutes:
+        time_desc = f"{hours}小时{minutes}分钟"
+    elif hours:
+        time_desc = f"{hours}小时"
+    else:
+        time_desc = f"{minutes}分钟"
+    return time_desc, f"{time_desc}({seconds}秒)"
+
+
+def calculate_expire_time(seconds: Optional[int], *, now: Optional[int] = None) -> Optional[int]:
     """计算到期时间戳
 
     Args:
         seconds: 屏蔽秒数，None表示永久
+        now: 当前时间戳，不传则取当前时间
 
     Returns:
         时间戳，None表示永久
@@ -80,28 +284,32 @@ def calculate_expire_time(seconds: Optional[int]) -> Optional[int]:
     if config.MAX_BLOCK_SECONDS > 0:
         seconds = min(seconds, config.MAX_BLOCK_SECONDS)
 
-    current_time = int(time.time())
-    return current_time + seconds
+    if now is None:
+        now = int(time.time())
+    return now + seconds
 
 
 def get_block_type_description(block_type: BlockType) -> str:
     """获取屏蔽类型的描述"""
-    descriptions = {
-        BlockType.PREVENT_TRIGGER: "禁止触发（可见但无法主动唤醒）",
-        BlockType.FULL_BLOCK: "完全屏蔽（完全不可见）",
-    }
-    return descriptions.get(block_type, str(block_type))
+    return BLOCK_TYPE_DESCRIPTIONS.get(block_type, str(block_type))
+
+
+async def _resolve_user(user: Union[str, DBUser]) -> Optional[DBUser]:
+    """获取用户对象，已是 DBUser 时直接返回，避免重复查询"""
+    if isinstance(user, DBUser):
+        return user
+    return await get_user_by_unique_id(user)
 
 
 async def apply_block_to_system(
-    user_id: str,
+    user: Union[str, DBUser],
     block_type: BlockType,
     expire_time: Optional[int],
 ) -> bool:
     """将屏蔽应用到系统层面
 
     Args:
-        user_id: 用户唯一标识
+        user: 已查询到的用户对象，或用户唯一标识
         block_type: 屏蔽类型
         expire_time: 到期时间戳
 
@@ -109,8 +317,8 @@ async def apply_block_to_system(
         是否成功
     """
     try:
-        user = await get_user_by_unique_id(user_id)
-        if not user:
+        db_user = await _resolve_user(user)
+        if not db_user:
             return False
 
         # 转换时间戳为datetime
@@ -120,41 +328,41 @@ async def apply_block_to_system(
 
         if block_type == BlockType.PREVENT_TRIGGER:
             # 设置禁止触发
-            user.prevent_trigger_until = cast(datetime, expire_datetime)
+            db_user.prevent_trigger_until = cast(datetime, expire_datetime)
+            await db_user.save(update_fields=["prevent_trigger_until"])
         else:
             # BlockType.FULL_BLOCK - 设置完全屏蔽（封禁）
-            user.ban_until = cast(datetime, expire_datetime)
-
-        await user.save()
+            db_user.ban_until = cast(datetime, expire_datetime)
+            await db_user.save(update_fields=["ban_until"])
     except Exception:
         return False
     else:
         return True
 
 
-async def remove_block_from_system(user_id: str, block_type: BlockType) -> bool:
+async def remove_block_from_system(user: Union[str, DBUser], block_type: BlockType) -> bool:
     """从系统层面移除屏蔽
 
     Args:
-        user_id: 用户唯一标识
+        user: 已查询到的用户对象，或用户唯一标识
         block_type: 屏蔽类型
 
     Returns:
         是否成功
     """
     try:
-        user = await get_user_by_unique_id(user_id)
-        if not user:
+        db_user = await _resolve_user(user)
+        if not db_user:
             return False
 
         # 使用cast处理类型检查，虽然赋值None但字段定义允许null
         if block_type == BlockType.PREVENT_TRIGGER:
-            user.prevent_trigger_until = cast(datetime, None)
+            db_user.prevent_trigger_until = cast(datetime, None)
+            await db_user.save(update_fields=["prevent_trigger_until"])
         else:
             # BlockType.FULL_BLOCK
-            user.ban_until = cast(datetime, None)
-
-        await user.save()
+            db_user.ban_until = cast(datetime, None)
+            await db_user.save(update_fields=["ban_until"])
     except Exception:
         return False
     else: